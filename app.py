@@ -1,7 +1,14 @@
 import os
+import asyncio
+import io
+import re
+import time
+import httpx
 import streamlit as st
+import numpy as np
 import pandas as pd
-import tempfile
+import pyarrow as pa
+from numba import njit
 from typing import Optional
 from agno.tools import tool
 from agno.models.groq import Groq
@@ -13,28 +20,110 @@ from dotenv import load_dotenv
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-@tool(
-    name="analyze_air_quality_csv",
-    show_result=True,
-    stop_after_tool_call=True,
+SAMPLE_CSV = (
+    b"date,pm25,pm10,no2\n"
+    b"2025-01-01,65,118,40\n"
+    b"2025-03-01,58,100,38\n"
+    b"2025-05-01,50,92,35\n"
+    b"2025-07-01,44,85,32\n"
 )
-
-
-
-def analyze_air_quality_csv(file_path: str) -> str:
-    df = pd.read_csv(file_path)
+SAMPLE_CSV_REF = "sample"
+
+POLLUTANTS = ("pm25", "pm2_5", "pm10", "no2", "so2", "co", "o3", "aqi")
+DATE_CANDIDATES = ("date", "timestamp", "day", "datetime")
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+# Token-content event names across agno releases ("RunContent" in 2.x, "RunResponseContent"/"RunResponse" in 1.x).
+STREAM_CONTENT_EVENTS = {"RunContent", "RunResponseContent", "RunResponse"}
+
+
+@st.cache_resource
+def csv_buffers() -> dict:
+    # Tool arguments come from the LLM as strings, so uploaded bytes stay in memory
+    # and the Data Analyst is handed the upload's file_id instead of a temp file path.
+    # The tool runs on a worker thread without session_state, hence a process-wide dict;
+    # entries only live for the duration of one run (see release_csv).
+    return {}
+
+
+def register_csv(file_id: str, data: bytes) -> str:
+    csv_buffers()[file_id] = data
+    return file_id
+
+
+def release_csv(file_id: str) -> None:
+    csv_buffers().pop(file_id, None)
+
+
+def read_air_quality_csv(source) -> pd.DataFrame:
+    # Arrow's multithreaded reader. It parses ISO dates itself, so describe_air_quality only casts those;
+    # date columns left as strings (non-ISO layouts) or numbers still go through pd.to_datetime.
+    return pd.read_csv(source, engine="pyarrow", dtype_backend="pyarrow")
+
+
+@st.cache_data
+def get_sample_df() -> pd.DataFrame:
+    return read_air_quality_csv(io.BytesIO(SAMPLE_CSV))
+
+
+@njit(cache=True)
+def trend_stats(arr, q):
+    # Single fused pass per column for the overall, first-q and last-q NaN-skipping means.
+    # No fastmath: it would let numba assume NaNs away and break the skip.
+    n, k = arr.shape
+    means = np.full(k, np.nan)
+    head = np.full(k, np.nan)
+    tail = np.full(k, np.nan)
+    for j in range(k):
+        total, h_total, t_total = 0.0, 0.0, 0.0
+        count, h_count, t_count = 0, 0, 0
+        for i in range(n):
+            v = arr[i, j]
+            if np.isnan(v):
+                continue
+            total += v
+            count += 1
+            if i < q:
+                h_total += v
+                h_count += 1
+            if i >= n - q:
+                t_total += v
+                t_count += 1
+        if count:
+            means[j] = total / count
+        if h_count:
+            head[j] = h_total / h_count
+        if t_count:
+            tail[j] = t_total / t_count
+    return means, head, tail
+
+
+def describe_air_quality(df: pd.DataFrame) -> str:
     df.columns = [c.strip().lower() for c in df.columns]
+    # Headers like "PM25" and "pm25 " collapse to one name; keep the first so df[col] stays a Series.
+    df = df.loc[:, ~df.columns.duplicated()]
     
-    date_col = None
-    for cand in ["date", "timestamp", "day", "datetime"]:
-        if cand in df.columns:
-            date_col = cand
-            break
+    cols = set(df.columns)
+    date_col = next((c for c in DATE_CANDIDATES if c in cols), None)
+    pollutants = [c for c in POLLUTANTS if c in cols]
+    # Readings don't need float64 precision; float32 halves the bytes the reductions stream through.
+    for pol in pollutants:
+        df[pol] = pd.to_numeric(df[pol], errors="coerce", downcast="float")
     if date_col:
-        df[date_col] = pd.to_datetime(df[date_col], errors="coerce")
-        df = df.sort_values(by=date_col)
+        dtype = df[date_col].dtype
+        arrow_type = dtype.pyarrow_dtype if isinstance(dtype, pd.ArrowDtype) else None
+        if arrow_type is not None and (pa.types.is_date(arrow_type) or pa.types.is_timestamp(arrow_type)):
+            # Already parsed by the Arrow reader; a cast is cheap, whereas to_datetime would iterate per element.
+            df[date_col] = df[date_col].astype(pd.ArrowDtype(pa.timestamp("ns", tz=getattr(arrow_type, "tz", None))))
+        else:
+            first = df[date_col].dropna().head(1)
+            # ISO strings take pandas' fast path instead of per-row format guessing.
+            fmt = "ISO8601" if len(first) and ISO_DATE.match(str(first.iloc[0])) else None
+            df[date_col] = pd.to_datetime(df[date_col], errors="coerce", format=fmt, cache=True)
+        # Row order only matters for the head/tail trend slices, so skip the sort for preview-only output.
+        if pollutants:
+            df = df.sort_values(by=date_col)
 
-    pollutants = [c for c in ["pm25", "pm2_5", "pm10", "no2", "so2", "co", "o3", "aqi"] if c in df.columns]
     desc = [f"Rows: {len(df)}"]
     if date_col and df[date_col].notna().any():
         start = df[date_col].min()
@@ -42,45 +131,79 @@ def analyze_air_quality_csv(file_path: str) -> str:
         desc.append(f"Date range: {start.date() if pd.notna(start) else 'N/A'} → {end.date() if pd.notna(end) else 'N/A'}")
 
     if pollutants:
-        means = df[pollutants].mean(numeric_only=True).to_dict()
-        means_str = "; ".join([f"{k}={v:.2f}" for k, v in means.items()])
+        # One contiguous float matrix feeds the overall means and both trend slices.
+        pol_arr = df[pollutants].to_numpy(dtype=np.float32, na_value=np.nan)
+        q = len(df) // 4
+        means, h_means, t_means = trend_stats(pol_arr, q)
+        means_str = "; ".join([f"{k}={v:.2f}" for k, v in zip(pollutants, means) if not np.isnan(v)])
         desc.append(f"Means: {means_str}")
 
         if date_col and df[date_col].notna().any() and len(df) >= 8:
-            q = len(df) // 4
-            head = df.head(q)
-            tail = df.tail(q)
-            trend_msgs = []
-            for pol in pollutants:
-                try:
-                    h, t = head[pol].mean(), tail[pol].mean()
-                    if pd.notna(h) and pd.notna(t):
-                        delta = t - h
-                        if abs(delta) < 1e-6:
-                            continue
-                        direction = "decreasing" if delta < 0 else "increasing"
-                        trend_msgs.append(f"{pol}: {direction} (~{delta:.2f})")
-                except Exception:
-                    pass
+            deltas = t_means - h_means
+            # NaN deltas (non-numeric or empty columns) compare False and drop out here.
+            mask = np.abs(deltas) >= 1e-6
+            trend_msgs = [
+                f"{pol}: {'decreasing' if delta < 0 else 'increasing'} (~{delta:.2f})"
+                for pol, delta in zip(np.array(pollutants)[mask], deltas[mask])
+            ]
             if trend_msgs:
                 desc.append("Simple trends: " + "; ".join(trend_msgs))
     else:
         desc.append("No standard pollutant columns found. Showing dataframe head:")
-        desc.append(df.head(5).to_string(index=False))
+        # Cap the preview width and use the C CSV writer; to_string pads every cell of wide frames.
+        desc.append(df.head(5).iloc[:, :8].to_csv(index=False).rstrip("\n"))
 
     return "\n".join(desc)
 
 
+@tool(
+    name="analyze_air_quality_csv",
+    show_result=True,
+    stop_after_tool_call=True,
+)
+
+
+
+def analyze_air_quality_csv(file_ref: str) -> str:
+    if file_ref == SAMPLE_CSV_REF:
+        return describe_air_quality(get_sample_df())
+    data = csv_buffers().get(file_ref)
+    # Only app-registered refs are readable; the LLM must not be able to point pandas at arbitrary paths or URLs.
+    if data is None:
+        return f"Unknown CSV reference '{file_ref}'."
+    # No DataFrame cache here: repeat runs on the same upload are answered by run_data's cache first.
+    return describe_air_quality(read_air_quality_csv(io.BytesIO(data)))
+
+
+@st.cache_resource
+def groq_http_client() -> httpx.Client:
+    # One keep-alive HTTP/2 pool for every agent, so task-force calls reuse warm TLS connections to Groq.
+    return httpx.Client(http2=True, limits=httpx.Limits(max_keepalive_connections=10))
+
+
+@st.cache_resource
 def groq_model(model_id: str = "qwen/qwen3-32b") -> Groq:
-    return Groq(id=model_id)
+    return Groq(id=model_id, http_client=groq_http_client())
+
 
+@st.cache_resource
+def search_tools() -> SearchToolClass:
+    return SearchToolClass()
 
+
+@st.cache_resource
+def hackernews_tools() -> HackerNewsToolClass:
+    return HackerNewsToolClass()
+
+
+# Agents keep per-run state (run id, response, session), so each call builds a fresh one
+# around the cached model and tool instances instead of sharing one across sessions.
 def make_news_analyst() -> Agent:
     return Agent(
         name="News Analyst",
         role="Finds recent city-level sustainability initiatives and green projects (past year).",
         model=groq_model(),
-        tools=[SearchToolClass()],
+        tools=[search_tools()],
         instructions="Cite sources and prefer official city pages or reputable news.",
         markdown=True,
     )
@@ -91,7 +214,7 @@ def make_policy_reviewer() -> Agent:
         name="Policy Reviewer",
         role="Summarizes municipal and regional sustainability policies and recent updates.",
         model=groq_model(),
-        tools=[SearchToolClass()],
+        tools=[search_tools()],
         instructions=(
             "Prefer .gov, city council, and official policy PDFs/pages; summarize key actions, dates, and status. "
             "Cite sources."
@@ -103,8 +226,8 @@ def make_policy_reviewer() -> Agent:
 def make_innovations_scout() -> Agent:
     tools = []
     if HackerNewsToolClass:
-        tools.append(HackerNewsToolClass())
-    tools.append(SearchToolClass()) 
+        tools.append(hackernews_tools())
+    tools.append(search_tools())
     return Agent(
         name="Innovations Scout",
         role="Finds innovative urban sustainability tech and pilots relevant to cities.",
@@ -142,44 +265,87 @@ def make_synthesizer() -> Agent:
     )
 
 
-def run_news(city: str) -> str:
-    agent = make_news_analyst()
-    prompt = (
+def news_prompt(city: str) -> str:
+    return (
         f"Find city-level sustainability projects in the past 12 months for {city}. "
         "Focus on official announcements, pilots, or deployments; include 3–6 examples and cite sources."
     )
-    resp = agent.run(prompt)
-    return str(resp.content) if hasattr(resp, "content") else str(resp)
 
 
-def run_policy(city: str) -> str:
-    agent = make_policy_reviewer()
-    prompt = (
+def policy_prompt(city: str) -> str:
+    return (
         f"Summarize recent government/city council sustainability policies for {city}. "
         "Include dates, status, and links; keep it to 6–10 bullet points."
     )
-    resp = agent.run(prompt)
-    return str(resp.content) if hasattr(resp, "content") else str(resp)
-
 
 
-def run_innovations(city: str) -> str:
-    agent = make_innovations_scout()
-    prompt = (
+def innovations_prompt(city: str) -> str:
+    return (
         f"Find innovative urban sustainability technologies relevant to {city} (or similar cities). "
         "Include pilots, startups, and academic demos from the last 18 months with source links."
     )
-    resp = agent.run(prompt)
+
+
+AGENT_FACTORIES = {
+    "News Analyst": make_news_analyst,
+    "Policy Reviewer": make_policy_reviewer,
+    "Innovations Scout": make_innovations_scout,
+}
+
+
+def stream_agent(agent: Agent, prompt: str):
+    # Yields content tokens as Groq produces them; tool-call and run lifecycle events are skipped.
+    for chunk in agent.run(prompt, stream=True):
+        if getattr(chunk, "event", None) in STREAM_CONTENT_EVENTS and isinstance(chunk.content, str):
+            yield chunk.content
+
+
+def agent_outputs() -> dict:
+    # Session-scoped (timestamp, answer) pairs keyed on (role, prompt), shared by Single Agent
+    # streaming and Full Task Force; entries expire after the same hour as the st.cache_data calls.
+    return st.session_state.setdefault("agent_outputs", {})
+
+
+def store_agent_output(role: str, prompt: str, answer: str) -> None:
+    agent_outputs()[(role, prompt)] = (time.time(), answer)
+
+
+def stream_or_replay(role: str, prompt: str) -> None:
+    stored = agent_outputs().get((role, prompt))
+    if stored and time.time() - stored[0] < 3600:
+        st.write(stored[1])
+    else:
+        store_agent_output(role, prompt, st.write_stream(stream_agent(AGENT_FACTORIES[role](), prompt)))
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def run_agent(role: str, prompt: str) -> str:
+    # The prompt text is part of the cache key, so editing a *_prompt helper invalidates old answers.
+    resp = AGENT_FACTORIES[role]().run(prompt)
     return str(resp.content) if hasattr(resp, "content") else str(resp)
 
 
-def run_data(csv_path: str) -> str:
+def run_news(city: str) -> str:
+    return run_agent("News Analyst", news_prompt(city))
+
+
+def run_policy(city: str) -> str:
+    return run_agent("Policy Reviewer", policy_prompt(city))
+
+
+def run_innovations(city: str) -> str:
+    return run_agent("Innovations Scout", innovations_prompt(city))
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def run_data(csv_ref: str) -> str:
     agent = make_data_analyst()
     # The tool is stop_after_tool_call=True, so just call it explicitly:
-    resp = agent.run(f"analyze the CSV at path '{csv_path}' using analyze_air_quality_csv")
+    resp = agent.run(f"analyze the CSV '{csv_ref}' using analyze_air_quality_csv")
     return str(resp.content) if hasattr(resp, "content") else str(resp)
 
 
+@st.cache_data(ttl=3600, show_spinner=False)
 def synthesize(news: str, policy: str, data: str, innovation: str, city: str) -> str:
     agent = make_synthesizer()
     prompt = (
@@ -195,6 +361,23 @@ def synthesize(news: str, policy: str, data: str, innovation: str, city: str) ->
     return str(resp.content) if hasattr(resp, "content") else str(resp)
 
 
+async def run_task_force(city: str, csv_ref: str) -> list:
+    # The four research agents are independent and I/O-bound (Groq + web search),
+    # so overlap them; the semaphore keeps us under Groq's rate limits.
+    limit = asyncio.Semaphore(4)
+
+    async def bounded(fn, *args):
+        async with limit:
+            return await asyncio.to_thread(fn, *args)
+
+    return await asyncio.gather(
+        bounded(run_news, city),
+        bounded(run_policy, city),
+        bounded(run_innovations, city),
+        bounded(run_data, csv_ref),
+    )
+
+
 st.set_page_config(page_title="Mission Sustainability – Agno Agents", page_icon="🌍", layout="wide")
 st.title("🌍 Multi-Agent Task Force: Mission Sustainability")
 
@@ -219,75 +402,53 @@ if mode == "Single Agent":
     if go:
         if agent_choice == "News Analyst":
             st.subheader("🗞️ News Analyst")
-            st.write(run_news(city))
+            stream_or_replay("News Analyst", news_prompt(city))
         elif agent_choice == "Policy Reviewer":
             st.subheader("📜 Policy Reviewer")
-            st.write(run_policy(city))
+            stream_or_replay("Policy Reviewer", policy_prompt(city))
         elif agent_choice == "Innovations Scout":
             st.subheader("💡 Innovations Scout")
-            st.write(run_innovations(city))
+            stream_or_replay("Innovations Scout", innovations_prompt(city))
         else:
             st.subheader("📊 Data Analyst")
             if uploaded is None:
                 if sample_note:
-                    # Create a tiny temp CSV for demo
-                    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
-                    tmp.write(
-                        b"date,pm25,pm10,no2\n"
-                        b"2025-01-01,65,118,40\n"
-                        b"2025-03-01,58,100,38\n"
-                        b"2025-05-01,50,92,35\n"
-                        b"2025-07-01,44,85,32\n"
-                    )
-                    tmp.flush()
-                    csv_path = tmp.name
+                    # Tiny in-memory CSV for demo
+                    csv_ref = SAMPLE_CSV_REF
                 else:
                     st.warning("Please upload a CSV or check the sample option.")
                     st.stop()
             else:
-                # Save the uploaded file
-                tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
-                tmp.write(uploaded.read())
-                tmp.flush()
-                csv_path = tmp.name
-            st.write(run_data(csv_path))
+                csv_ref = register_csv(uploaded.file_id, uploaded.getvalue())
+            try:
+                st.write(run_data(csv_ref))
+            finally:
+                release_csv(csv_ref)
 
 else:
     go_all = st.button("🚀 Run Full Task Force")
     if go_all:
-        st.subheader("🗞️ News Analyst")
-        news = run_news(city)
-        st.write(news)
-
-        st.subheader("📜 Policy Reviewer")
-        policy = run_policy(city)
-        st.write(policy)
-
-        st.subheader("💡 Innovations Scout")
-        innovations = run_innovations(city)
-        st.write(innovations)
-
-        st.subheader("📊 Data Analyst")
         if uploaded is None:
             # Use a small in-memory sample if needed
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
-            tmp.write(
-                b"date,pm25,pm10,no2\n"
-                b"2025-01-01,65,118,40\n"
-                b"2025-03-01,58,100,38\n"
-                b"2025-05-01,50,92,35\n"
-                b"2025-07-01,44,85,32\n"
-            )
-            tmp.flush()
-            csv_path = tmp.name
+            csv_ref = SAMPLE_CSV_REF
         else:
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
-            tmp.write(uploaded.read())
-            tmp.flush()
-            csv_path = tmp.name
-        data_summary = run_data(csv_path)
-        st.write(data_summary)
-
-        st.subheader("🧩 Combined Sustainability Proposal")
-        proposal = synthesize(news, policy, data_summary, innovations, city)
-        st.write(proposal)
+            csv_ref = register_csv(uploaded.file_id, uploaded.getvalue())
+
+        # Reserve the layout up front, then fill every slot in the same frame once the agents return.
+        slots = {name: st.empty() for name in ["news", "policy", "innov", "data"]}
+        with st.spinner("Running News, Policy, Innovations and Data agents..."):
+            try:
+                news, policy, innovations, data_summary = asyncio.run(run_task_force(city, csv_ref))
+            finally:
+                release_csv(csv_ref)
+        slots["news"].markdown(f"### 🗞️ News Analyst\n\n{news}")
+        slots["policy"].markdown(f"### 📜 Policy Reviewer\n\n{policy}")
+        slots["innov"].markdown(f"### 💡 Innovations Scout\n\n{innovations}")
+        slots["data"].markdown(f"### 📊 Data Analyst\n\n{data_summary}")
+        store_agent_output("News Analyst", news_prompt(city), news)
+        store_agent_output("Policy Reviewer", policy_prompt(city), policy)
+        store_agent_output("Innovations Scout", innovations_prompt(city), innovations)
+
+        with st.spinner("Synthesizing the combined proposal..."):
+            proposal = synthesize(news, policy, data_summary, innovations, city)
+        st.markdown(f"### 🧩 Combined Sustainability Proposal\n\n{proposal}")